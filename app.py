@@ -1,8 +1,9 @@
+from collections import deque
 import streamlit as st
 from logic.api_setup import setup_gemini_api
 from logic.pdf_processor import process_pdf
-from logic.qa_engine import create_qa_chain, get_answer
-from logic.utils import display_sources
+from logic.qa_engine import create_qa_chain, get_answer, get_batch_answers, stream_answer
+from logic.utils import build_source_previews, display_message, display_sources
 
 # Page configuration
 st.set_page_config(
@@ -11,8 +12,11 @@ st.set_page_config(
     layout="wide"
 )
 
+MAX_MESSAGES = 200     # older messages are dropped from the session entirely
+RECENT_MESSAGES = 20   # rendered on every rerun; the rest only on request
+
 # Session state initialization
-if 'messages' not in st.session_state: st.session_state.messages = []
+if 'messages' not in st.session_state: st.session_state.messages = deque(maxlen=MAX_MESSAGES)
 if 'qa_chain' not in st.session_state: st.session_state.qa_chain = None
 if 'processed_file' not in st.session_state: st.session_state.processed_file = None
 if 'message_counter' not in st.session_state: st.session_state.message_counter = 0
@@ -34,15 +38,15 @@ with upload_col:
     if uploaded_file:
         st.success(f"📁 Uploaded: {uploaded_file.name} ({uploaded_file.size / 1024:.1f} KB)")
         if st.button("🔄 Process PDF", use_container_width=True):
-            vectorstore, num_chunks = process_pdf(uploaded_file, api_key)
-            if vectorstore:
-                qa_chain = create_qa_chain(vectorstore, api_key)
+            vectorstore, chunks = process_pdf(uploaded_file, api_key)
+            qa_chain = create_qa_chain(vectorstore, chunks, api_key) if vectorstore else None
+            if qa_chain:
                 st.session_state.qa_chain = qa_chain
                 st.session_state.processed_file = uploaded_file.name
-                st.session_state.messages = []
+                st.session_state.messages = deque(maxlen=MAX_MESSAGES)
                 st.session_state.message_counter = 0
                 st.balloons()
-                st.success(f"✅ Processed {num_chunks} chunks from PDF!")
+                st.success(f"✅ Processed {len(chunks)} chunks from PDF!")
 
     if st.session_state.processed_file:
         st.info(f"📋 Current file: {st.session_state.processed_file}")
@@ -94,13 +98,36 @@ for col, question in zip(sample_cols, sample_questions):
                     st.session_state.messages.append({
                         "role": "assistant",
                         "content": answer,
-                        "sources": sources,
+                        "source_previews": build_source_previews(sources),
                         "id": st.session_state.message_counter
                     })
                 st.rerun()
             else:
                 st.warning("⚠️ Please process a PDF first!")
 
+if st.button("🧩 Ask all sample questions", use_container_width=True):
+    if st.session_state.qa_chain:
+        answers, source_lists = get_batch_answers(sample_questions, st.session_state.qa_chain)
+        for question, answer, sources in zip(sample_questions, answers, source_lists):
+            st.session_state.message_counter += 1
+            st.session_state.messages.append({
+                "role": "user",
+                "content": question,
+                "id": st.session_state.message_counter
+            })
+            st.session_state.message_counter += 1
+            st.session_state.messages.append({
+                "role": "assistant",
+                "content": answer or "No separate answer was returned for this question.",
+                "source_previews": build_source_previews(sources),
+                "id": st.session_state.message_counter
+            })
+        # On failure get_batch_answers has shown an error; a rerun would clear it
+        if answers:
+            st.rerun()
+    else:
+        st.warning("⚠️ Please process a PDF first!")
+
 # Chat Interface
 st.markdown("---")
 st.header("💬 Chat with your PDF")
@@ -109,11 +136,13 @@ if not st.session_state.qa_chain:
     st.warning("⚠️ Please upload and process a PDF to begin chatting.")
 else:
     with st.container():
-        for msg in st.session_state.messages:
-            with st.chat_message(msg["role"]):
-                st.write(msg["content"])
-                if msg["role"] == "assistant" and "sources" in msg:
-                    display_sources(msg["sources"], msg["id"])
+        messages = list(st.session_state.messages)
+        older, recent = messages[:-RECENT_MESSAGES], messages[-RECENT_MESSAGES:]
+        if older and st.toggle("Show older messages", key="show_older_messages"):
+            for msg in older:
+                display_message(msg)
+        for msg in recent:
+            display_message(msg)
 
     if prompt := st.chat_input("Ask a question about your PDF..."):
         st.session_state.message_counter += 1
@@ -126,18 +155,21 @@ else:
             st.write(prompt)
 
         with st.chat_message("assistant"):
-            with st.spinner("Generating response..."):
-                answer, sources = get_answer(prompt, st.session_state.qa_chain)
+            token_iter, sources = stream_answer(prompt, st.session_state.qa_chain)
+            if token_iter:
+                try:
+                    answer = st.write_stream(token_iter)
+                except Exception:
+                    answer = None  # already reported by stream_answer; don't keep a truncated reply
                 if answer:
-                    st.write(answer)
                     st.session_state.message_counter += 1
                     st.session_state.messages.append({
                         "role": "assistant",
                         "content": answer,
-                        "sources": sources,
+                        "source_previews": build_source_previews(sources),
                         "id": st.session_state.message_counter
                     })
-                    display_sources(sources, st.session_state.message_counter)
+                    display_sources(st.session_state.messages[-1]["source_previews"])
 
 # Chat Controls
 st.markdown("---")
@@ -146,7 +178,7 @@ with col1:
     st.metric("💬 Messages", len(st.session_state.messages))
 with col2:
     if st.button("🗑️ Clear Chat", use_container_width=True):
-        st.session_state.messages = []
+        st.session_state.messages = deque(maxlen=MAX_MESSAGES)
         st.session_state.message_counter = 0
         st.rerun()
 with col3:
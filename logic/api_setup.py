@@ -1,6 +1,7 @@
 import os
 import streamlit as st
 import google.generativeai as genai
+from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
 
 def setup_gemini_api():
     api_key = None
@@ -20,3 +21,18 @@ def setup_gemini_api():
 
     genai.configure(api_key=api_key)
     return api_key
+
+@st.cache_resource(show_spinner=False)
+def get_embeddings(api_key):
+    return GoogleGenerativeAIEmbeddings(
+        model="models/embedding-001",
+        google_api_key=api_key
+    )
+
+@st.cache_resource(show_spinner=False)
+def get_llm(api_key):
+    return ChatGoogleGenerativeAI(
+        model="models/gemini-2.0-flash",
+        google_api_key=api_key,
+        temperature=0.3
+    )
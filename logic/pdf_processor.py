@@ -1,43 +1,240 @@
+import gc
+import hashlib
 import os
+import shutil
+import sqlite3
 import tempfile
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
 import chromadb
-from langchain_community.document_loaders import PyPDFLoader
+import numpy as np
+from google.api_core.exceptions import ResourceExhausted
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
+from langchain_community.document_loaders import PyMuPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_community.vectorstores import Chroma
+from langchain_community.vectorstores import Chroma, FAISS
+from langchain_core.documents import Document
 import streamlit as st
+from logic.api_setup import get_embeddings
+from logic.quantization import BinaryQuantizedVectorStore
 
-def process_pdf(uploaded_file, api_key):
-    try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
-            tmp_file_path = tmp_file.name
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
+CHROMA_DIR = "./chroma_db"
+FAISS_DIR = "./faiss_index"
+BINARY_DIR = "./binary_index"
+EMBED_BATCH_SIZE = 16
+EMBED_WORKERS = 8
+
+# Chunk by tokens rather than characters so chunks line up with the embedding model's window
+_SPLITTER = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+    encoding_name="cl100k_base",
+    chunk_size=500,
+    chunk_overlap=50
+)
+
+def _is_rate_limited(exc):
+    return isinstance(exc, ResourceExhausted) or "429" in str(exc)
+
+@retry(
+    retry=retry_if_exception(_is_rate_limited),
+    wait=wait_exponential(multiplier=1, max=30),
+    stop=stop_after_attempt(5),
+    reraise=True
+)
+def _embed_batch(embeddings, batch):
+    return np.asarray(embeddings.embed_documents(batch), dtype=np.float32)
+
+def embed_in_parallel(embeddings, docs):
+    """Embed docs in small sub-batches with several requests in flight at once, as one float32 array"""
+    if not docs:
+        return np.empty((0, 0), dtype=np.float32)
+
+    batches = [docs[i:i + EMBED_BATCH_SIZE] for i in range(0, len(docs), EMBED_BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as executor:
+        return np.vstack(list(executor.map(lambda batch: _embed_batch(embeddings, batch), batches)))
+
+def _embed_in_groups(embeddings, docs, group_size):
+    """Yield (start, end, vectors) for consecutive groups of about group_size docs
+
+    Every sub-batch is submitted to one pool up front, so all workers stay busy
+    while the caller handles each group as soon as its sub-batches finish.
+    """
+    batches_per_group = max(1, group_size // EMBED_BATCH_SIZE)
+    with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as executor:
+        futures = [
+            executor.submit(_embed_batch, embeddings, docs[i:i + EMBED_BATCH_SIZE])
+            for i in range(0, len(docs), EMBED_BATCH_SIZE)
+        ]
+        try:
+            for first in range(0, len(futures), batches_per_group):
+                start = first * EMBED_BATCH_SIZE
+                end = min(start + batches_per_group * EMBED_BATCH_SIZE, len(docs))
+                vectors = np.vstack([f.result() for f in futures[first:first + batches_per_group]])
+                yield start, end, vectors
+        finally:
+            # Don't keep calling the API for a run that has already failed
+            for future in futures:
+                future.cancel()
+
+@st.cache_resource(show_spinner=False)
+def _get_chroma_client():
+    # WAL lets batch commits append to a log instead of rewriting pages; the mode is
+    # stored in the database file, so Chroma's own connections pick it up
+    os.makedirs(CHROMA_DIR, exist_ok=True)
+    with closing(sqlite3.connect(os.path.join(CHROMA_DIR, "chroma.sqlite3"))) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+
+    return chromadb.PersistentClient(
+        path=CHROMA_DIR,
+        settings=chromadb.config.Settings(anonymized_telemetry=False)
+    )
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _process_pdf_cached(doc_id, _file_bytes, api_key, batch_size=200):
+    """Build the vectorstore for a PDF, memoized on the hash of its contents"""
+    embeddings = get_embeddings(api_key)
+    index_name = f"pdf_{doc_id}"
+
+    # A PDF indexed in an earlier session is reopened without loading or splitting it again
+    vectorstore, texts = _open_index(index_name, embeddings)
+    if vectorstore is not None:
+        return vectorstore, texts
+
+    texts = _load_and_split(_file_bytes)
+    if not texts:
+        raise ValueError("No text could be extracted from this PDF (it may be a scanned image)")
 
-        loader = PyPDFLoader(tmp_file_path)
+    if VECTOR_BACKEND == "faiss":
+        vectorstore = _index_faiss(index_name, texts, embeddings)
+    elif VECTOR_BACKEND == "binary":
+        vectorstore = _index_binary(index_name, texts, embeddings)
+    else:
+        vectorstore = _index_chroma(index_name, texts, embeddings, batch_size)
+
+    # The indexing helpers' embedding arrays and per-batch lists are gone by now;
+    # collect any reference cycles they left so memory is returned before the next upload
+    gc.collect()
+    return vectorstore, texts
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _load_and_split(file_bytes):
+    """Load and chunk a PDF; the chunks are plain Documents, so they can be pickled into the cache"""
+    # The directory is removed even if loading fails; a NamedTemporaryFile(delete=True)
+    # could not be reopened by the loader on Windows while it is still open
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_file_path = os.path.join(tmp_dir, "upload.pdf")
+        with open(tmp_file_path, "wb") as tmp_file:
+            tmp_file.write(file_bytes)
+
+        loader = PyMuPDFLoader(tmp_file_path)
         documents = loader.load()
 
-        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        texts = splitter.split_documents(documents)
+    return _SPLITTER.split_documents(documents)
+
+def _open_index(index_name, embeddings):
+    if VECTOR_BACKEND == "faiss":
+        index_path = os.path.join(FAISS_DIR, index_name)
+        if os.path.exists(index_path):
+            try:
+                # Index files are written by this app, so loading the pickled docstore is safe
+                vectorstore = FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
+                texts = [vectorstore.docstore.search(i) for i in vectorstore.index_to_docstore_id.values()]
+                return vectorstore, texts
+            except Exception:
+                # Unreadable index (e.g. from an interrupted save); rebuild it
+                shutil.rmtree(index_path, ignore_errors=True)
+    elif VECTOR_BACKEND == "binary":
+        index_path = os.path.join(BINARY_DIR, index_name)
+        if os.path.exists(index_path):
+            try:
+                vectorstore = BinaryQuantizedVectorStore.load_local(index_path, embeddings)
+                return vectorstore, vectorstore.documents
+            except Exception:
+                shutil.rmtree(index_path, ignore_errors=True)
+    else:
+        # No metadata here: passing it for an existing collection would replace the
+        # num_chunks marker; _index_chroma sets the real metadata when it recreates it
+        collection = _get_chroma_client().get_or_create_collection(name=index_name)
+        # Collections are created with their expected size, so a short count means an interrupted run
+        num_chunks = (collection.metadata or {}).get("num_chunks")
+        if num_chunks and collection.count() == num_chunks:
+            stored = collection.get(include=["documents", "metadatas"])
+            texts = [
+                Document(page_content=text, metadata=meta or {})
+                for text, meta in zip(stored["documents"], stored["metadatas"])
+            ]
+            return _chroma_vectorstore(index_name, embeddings), texts
+    return None, []
+
+def _chroma_vectorstore(collection_name, embeddings):
+    return Chroma(
+        client=_get_chroma_client(),
+        collection_name=collection_name,
+        embedding_function=embeddings
+    )
+
+def _index_chroma(collection_name, texts, embeddings, batch_size):
+    # _open_index has already created the collection, so drop whatever partial
+    # or outdated contents it holds and start over
+    chroma_client = _get_chroma_client()
+    chroma_client.delete_collection(collection_name)
+    collection = chroma_client.create_collection(
+        name=collection_name,
+        metadata={"hnsw:space": "cosine", "num_chunks": len(texts)}
+    )
+
+    # Write to Chroma in batches so each insert transaction covers many chunks,
+    # handing each batch to a writer thread while later ones are still embedding
+    docs = [t.page_content for t in texts]
+    metas = [t.metadata for t in texts]
+    ids = [f"{collection_name}_{i}" for i in range(len(texts))]
 
-        embeddings = GoogleGenerativeAIEmbeddings(
-            model="models/embedding-001",
-            google_api_key=api_key
-        )
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        writes = []
+        for start, end, vectors in _embed_in_groups(embeddings, docs, batch_size):
+            writes.append(writer.submit(
+                collection.add,
+                ids=ids[start:end],
+                embeddings=vectors,
+                documents=docs[start:end],
+                metadatas=metas[start:end]
+            ))
+        # Surface the first failed write, if any
+        for write in writes:
+            write.result()
 
-        collection_name = f"pdf_collection_{hash(uploaded_file.name) % 10000}"
-        chroma_client = chromadb.Client(chromadb.config.Settings(anonymized_telemetry=False))
+    return _chroma_vectorstore(collection_name, embeddings)
 
-        vectorstore = Chroma.from_documents(
-            documents=texts,
-            embedding=embeddings,
-            collection_name=collection_name,
-            persist_directory="./chroma_db",
-            client=chroma_client
-        )
+def _index_faiss(index_name, texts, embeddings):
+    docs = [t.page_content for t in texts]
+    metas = [t.metadata for t in texts]
+    vectors = embed_in_parallel(embeddings, docs)
+
+    vectorstore = FAISS.from_embeddings(list(zip(docs, vectors)), embeddings, metadatas=metas)
+    _save_index(vectorstore.save_local, os.path.join(FAISS_DIR, index_name))
+    return vectorstore
+
+def _index_binary(index_name, texts, embeddings):
+    vectors = embed_in_parallel(embeddings, [t.page_content for t in texts])
+
+    index_path = os.path.join(BINARY_DIR, index_name)
+    _save_index(BinaryQuantizedVectorStore(embeddings, texts, vectors).save_local, index_path)
+    # Reopen so the float32 vectors are memory-mapped instead of held in RAM
+    return BinaryQuantizedVectorStore.load_local(index_path, embeddings)
+
+def _save_index(save_local, index_path):
+    """Save into a scratch directory and move it into place, so index_path only ever holds a complete index"""
+    tmp_path = f"{index_path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)  # left behind by an earlier crash
+    save_local(tmp_path)
+    os.replace(tmp_path, index_path)
+
+def process_pdf(uploaded_file, api_key, batch_size=200):
+    try:
+        file_bytes = uploaded_file.getvalue()
+        doc_id = hashlib.sha256(file_bytes).hexdigest()[:16]
+        return _process_pdf_cached(doc_id, file_bytes, api_key, batch_size)
 
-        os.unlink(tmp_file_path)
-        return vectorstore, len(texts)
-    
     except Exception as e:
         st.error(f"Error processing PDF: {str(e)}")
-        return None, 0
+        return None, []
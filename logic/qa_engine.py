@@ -1,9 +1,52 @@
+import re
+from functools import lru_cache
+from typing import Any, Callable, List
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain.retrievers import EnsembleRetriever
+from langchain_community.retrievers import BM25Retriever
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from sentence_transformers import CrossEncoder
 import streamlit as st
+from logic.api_setup import get_llm
 
-def create_qa_chain(vectorstore, api_key):
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+@st.cache_resource(show_spinner=False)
+def get_reranker():
+    return CrossEncoder(RERANK_MODEL)
+
+class CachedEmbeddingRetriever(BaseRetriever):
+    """Vector retriever that embeds each distinct question only once"""
+    vectorstore: Any
+    embed_query: Callable[[str], List[float]]
+    k: int = 4
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore, k=4, cache_size=256):
+        embed_query = lru_cache(maxsize=cache_size)(vectorstore.embeddings.embed_query)
+        return cls(vectorstore=vectorstore, embed_query=embed_query, k=k)
+
+    def _get_relevant_documents(self, query, *, run_manager) -> List[Document]:
+        return self.vectorstore.similarity_search_by_vector(self.embed_query(query), k=self.k)
+
+class RerankingRetriever(BaseRetriever):
+    """Retrieves a wide candidate set and keeps the passages a cross-encoder scores highest"""
+    base_retriever: BaseRetriever
+    reranker: Any
+    top_n: int = 4
+
+    def _get_relevant_documents(self, query, *, run_manager) -> List[Document]:
+        candidates = self.base_retriever.invoke(query)
+        if len(candidates) <= 1:
+            return candidates
+
+        scores = self.reranker.predict([(query, doc.page_content) for doc in candidates])
+        ranked = sorted(zip(scores, range(len(candidates))), reverse=True)
+        return [candidates[i] for _, i in ranked[:self.top_n]]
+
+def create_qa_chain(vectorstore, chunks, api_key):
     prompt_template = """
     You are a helpful AI assistant...
     Context:
@@ -13,19 +56,35 @@ def create_qa_chain(vectorstore, api_key):
 
     PROMPT = PromptTemplate(template=prompt_template, input_variables=["context", "question"])
 
-    llm = ChatGoogleGenerativeAI(
-        model="models/gemini-2.0-flash",
-        google_api_key=api_key,
-        temperature=0.3
-    )
+    try:
+        llm = get_llm(api_key)
+
+        dense_retriever = CachedEmbeddingRetriever.from_vectorstore(vectorstore, k=10)
+        if chunks:
+            # Fuse keyword and dense results so exact terms (acronyms, names) are not missed
+            hybrid_retriever = EnsembleRetriever(
+                retrievers=[BM25Retriever.from_documents(chunks, k=10), dense_retriever],
+                weights=[0.4, 0.6]
+            )
+        else:
+            # BM25 cannot be built over an empty corpus
+            hybrid_retriever = dense_retriever
 
-    qa_chain = RetrievalQA.from_chain_type(
-        llm=llm,
-        chain_type="stuff",
-        retriever=vectorstore.as_retriever(search_kwargs={"k": 4}),
-        return_source_documents=True,
-        chain_type_kwargs={"prompt": PROMPT}
-    )
+        qa_chain = RetrievalQA.from_chain_type(
+            llm=llm,
+            chain_type="stuff",
+            retriever=RerankingRetriever(
+                base_retriever=hybrid_retriever,
+                reranker=get_reranker(),
+                top_n=4
+            ),
+            return_source_documents=True,
+            chain_type_kwargs={"prompt": PROMPT}
+        )
+    except Exception as e:
+        # e.g. the reranker model could not be downloaded
+        st.error(f"Error creating QA chain: {str(e)}")
+        return None
 
     return qa_chain
 
@@ -37,3 +96,67 @@ def get_answer(question, qa_chain):
     except Exception as e:
         st.error(f"Error getting answer: {str(e)}")
         return None, []
+
+def get_batch_answers(questions, qa_chain):
+    """Answer several questions with one LLM call, returning one answer and one source list per question"""
+    try:
+        with st.spinner("🤔 Thinking..."):
+            # Retrieval makes no LLM calls, so each question keeps its own context;
+            # only the generation step is shared
+            sources = [qa_chain.retriever.invoke(question) for question in questions]
+            context = "\n\n".join(
+                f"Context for question {i}:\n" + "\n\n".join(doc.page_content for doc in docs)
+                for i, docs in enumerate(sources, 1)
+            )
+            numbered = "\n".join(f"{i}. {question}" for i, question in enumerate(questions, 1))
+            query = (
+                "Answer each of the following questions separately, using the context given for it. "
+                "Start each answer on its own line with a heading of the form \"### Answer N\", "
+                "where N is the question number.\n" + numbered
+            )
+
+            llm_chain = qa_chain.combine_documents_chain.llm_chain
+            prompt = llm_chain.prompt.format(context=context, question=query)
+            answer = llm_chain.llm.invoke(prompt).content
+    except Exception as e:
+        st.error(f"Error getting answer: {str(e)}")
+        return [], []
+    return _split_numbered_answers(answer, len(questions)), sources
+
+def _split_numbered_answers(text, count):
+    # Accept "### Answer 1", "### Answer 1: Title" and "**Answer 1**" headings; the "#"/"**"
+    # marker is required so a body line like "Answer 2 is below." is not taken as one
+    parts = re.split(r"^\s*(?:#+|\*\*)\s*Answer\s+(\d+)\b.*$", text, flags=re.MULTILINE)
+    answers = {}
+    for number, body in zip(parts[1::2], parts[2::2]):
+        answers.setdefault(int(number), body.strip())
+
+    # If the model ignored the headings, keep the whole reply rather than dropping it
+    if not answers:
+        answers[1] = text.strip()
+    return [answers.get(i, "") for i in range(1, count + 1)]
+
+def stream_answer(question, qa_chain):
+    """Retrieve context, then stream the answer token by token instead of waiting for the full result"""
+    try:
+        with st.spinner("🤔 Thinking..."):
+            sources = qa_chain.retriever.invoke(question)
+
+        # Build the same prompt the "stuff" chain would, so the LLM can be streamed directly
+        llm_chain = qa_chain.combine_documents_chain.llm_chain
+        context = "\n\n".join(doc.page_content for doc in sources)
+        prompt = llm_chain.prompt.format(context=context, question=question)
+    except Exception as e:
+        st.error(f"Error getting answer: {str(e)}")
+        return None, []
+
+    def tokens():
+        try:
+            for chunk in llm_chain.llm.stream(prompt):
+                yield chunk.content
+        except Exception as e:
+            st.error(f"Error getting answer: {str(e)}")
+            # Let the caller know the answer is incomplete so it is not saved
+            raise
+
+    return tokens(), sources
@@ -0,0 +1,92 @@
+import json
+import os
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+def binary_quantize(vectors):
+    """Keep only the sign of each dimension, packed 8 dimensions per byte"""
+    return np.packbits(np.asarray(vectors) > 0, axis=-1)
+
+def _build_binary_index(vectors):
+    if vectors.size == 0:
+        return None
+    index = faiss.IndexBinaryFlat(vectors.shape[1])
+    index.add(binary_quantize(vectors))
+    return index
+
+class BinaryQuantizedVectorStore(VectorStore):
+    """Searches sign-bit codes with FAISS and rescores the shortlist with full-precision vectors
+
+    Only the codes (1 bit per dimension) need to stay in RAM; a store opened with
+    load_local memory-maps the float32 vectors, so rescoring reads just the shortlisted rows.
+    """
+
+    def __init__(self, embedding, documents, vectors, rescore_multiplier=4, index=None):
+        self._embedding = embedding
+        self.documents = list(documents)
+        self.vectors = np.asarray(vectors, dtype=np.float32)
+        self.index = index if index is not None else _build_binary_index(self.vectors)
+        self.rescore_multiplier = rescore_multiplier
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = np.asarray(self._embedding.embed_documents(texts), dtype=np.float32)
+
+        start = len(self.documents)
+        self.documents.extend(Document(page_content=t, metadata=m) for t, m in zip(texts, metadatas))
+        if self.index is None:
+            self.vectors = vectors
+            self.index = _build_binary_index(vectors)
+        else:
+            self.vectors = np.vstack([self.vectors, vectors])
+            self.index.add(binary_quantize(vectors))
+        return [str(i) for i in range(start, len(self.documents))]
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        store = cls(embedding, [], np.empty((0, 0), dtype=np.float32), **kwargs)
+        store.add_texts(texts, metadatas)
+        return store
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return self.similarity_search_by_vector(self._embedding.embed_query(query), k=k)
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        query = np.asarray(embedding, dtype=np.float32)
+        num_candidates = min(len(self.documents), k * self.rescore_multiplier)
+        if num_candidates == 0:
+            return []
+
+        # Shortlist by Hamming distance (FAISS uses hardware popcount), then rescore
+        # the shortlist with cosine similarity on the original vectors
+        _, ids = self.index.search(binary_quantize(query.reshape(1, -1)), num_candidates)
+        # Sorted so reads from a memory-mapped matrix move forward through the file
+        candidates = np.sort(ids[0][ids[0] >= 0])
+        candidate_vectors = np.asarray(self.vectors[candidates])
+        norms = np.linalg.norm(candidate_vectors, axis=1) * np.linalg.norm(query)
+        scores = candidate_vectors @ query / np.maximum(norms, 1e-10)
+
+        best = candidates[np.argsort(-scores)[:k]]
+        return [self.documents[i] for i in best]
+
+    def save_local(self, path):
+        os.makedirs(path, exist_ok=True)
+        faiss.write_index_binary(self.index, os.path.join(path, "codes.index"))
+        np.save(os.path.join(path, "vectors.npy"), self.vectors)
+        with open(os.path.join(path, "documents.json"), "w", encoding="utf-8") as f:
+            json.dump([{"page_content": d.page_content, "metadata": d.metadata} for d in self.documents], f)
+
+    @classmethod
+    def load_local(cls, path, embedding, **kwargs):
+        with open(os.path.join(path, "documents.json"), encoding="utf-8") as f:
+            documents = [Document(**doc) for doc in json.load(f)]
+        index = faiss.read_index_binary(os.path.join(path, "codes.index"))
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        return cls(embedding, documents, vectors, index=index, **kwargs)
@@ -1,22 +1,36 @@
+import uuid
 import streamlit as st
 
-def display_sources(sources, message_id):
-    """Display sources with unique keys"""
-    if sources:
+def build_source_previews(sources):
+    """Precompute what display_sources renders, so reruns don't re-slice every source"""
+    previews = []
+    for source in sources:
+        content = source.page_content[:500] + "..." if len(source.page_content) > 500 else source.page_content
+        page = source.metadata.get('page', 'Unknown') if getattr(source, 'metadata', None) else None
+        # A random key assigned once keeps each text area's identity stable across reruns
+        previews.append((content, page, uuid.uuid4().hex))
+    return previews
+
+def display_sources(source_previews):
+    """Display precomputed source previews"""
+    if source_previews:
         with st.expander("📖 View Sources", expanded=False):
-            for i, source in enumerate(sources):
+            for i, (content, page, unique_key) in enumerate(source_previews):
                 st.markdown(f"*Source {i+1}:*")
-                
-                # Create unique key for each text area
-                unique_key = f"source_{message_id}{i}{hash(source.page_content[:50]) % 1000}"
-                
+
                 st.text_area(
                     f"Content {i+1}:",
-                    source.page_content[:500] + "..." if len(source.page_content) > 500 else source.page_content,
+                    content,
                     height=100,
                     key=unique_key
                 )
-                if hasattr(source, 'metadata') and source.metadata:
-                    st.caption(f"📄 Page: {source.metadata.get('page', 'Unknown')}")
+                if page is not None:
+                    st.caption(f"📄 Page: {page}")
                 st.markdown("---")
 
+def display_message(msg):
+    """Display a chat message and, for answers, its sources"""
+    with st.chat_message(msg["role"]):
+        st.write(msg["content"])
+        if msg["role"] == "assistant" and "source_previews" in msg:
+            display_sources(msg["source_previews"])
@@ -13,17 +13,21 @@ def install_requirements():
     
     # Install packages one by one to handle potential conflicts
     packages = [
-        "streamlit>=1.28.0",
+        "streamlit>=1.31.0",
         "python-dotenv>=1.0.0",
         "google-generativeai>=0.3.0",
-        "pypdf>=3.17.0",
+        "pymupdf>=1.23.0",
         "numpy>=1.21.0,<1.25.0",  # Use older numpy to avoid compilation issues
         "pandas>=1.3.0",
         "langchain>=0.1.0",
         "langchain-community>=0.0.10",
         "langchain-google-genai>=0.0.6",
-        "chromadb>=0.4.15",
-        "tiktoken>=0.5.0"
+        "chromadb>=0.5.5",
+        "tiktoken>=0.5.0",
+        "tenacity>=8.2.0",
+        "faiss-cpu>=1.7.4",
+        "sentence-transformers>=2.2.0",
+        "rank-bm25>=0.2.2"
     ]
     
     for package in packages: